@@ -1,4 +1,5 @@
 import os
+import logging
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -22,6 +23,17 @@ app = Flask(__name__)
 app.secret_key = 'smart_farming_assistant_2024_secret_key'
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 
+# utils.db reports through logging; set DB_LOG_LEVEL=WARNING to quiet it in production
+db_log = logging.getLogger('utils.db')
+db_log.addHandler(logging.StreamHandler())
+# The handler above prints it; don't print it again through the root logger
+db_log.propagate = False
+db_log_level = os.getenv('DB_LOG_LEVEL', 'INFO').upper()
+if not isinstance(logging.getLevelName(db_log_level), int):
+    print(f"⚠️ Unknown DB_LOG_LEVEL {db_log_level!r}, using INFO")
+    db_log_level = 'INFO'
+db_log.setLevel(db_log_level)
+
 # Initialize MongoDB connection
 try:
     init_db(app)
@@ -109,7 +109,7 @@ def accept_request(equipment_id):
         # 3. Remove the actionable notification
         if notification_id:
             from utils.db import delete_notification
-            delete_notification(notification_id)
+            delete_notification(notification_id, session.get('user_id'))
             
         return jsonify({'success': True})
     return jsonify({'error': 'Failed to accept request'}), 500
@@ -140,7 +140,7 @@ def reject_request(equipment_id):
         # 3. Remove the actionable notification
         if notification_id:
             from utils.db import delete_notification
-            delete_notification(notification_id)
+            delete_notification(notification_id, session.get('user_id'))
             
         return jsonify({'success': True})
     return jsonify({'error': 'Failed to reject request'}), 500
@@ -2,8 +2,8 @@ import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report, confusion_matrix
+from sklearn.metrics import (accuracy_score, precision_score, recall_score, f1_score,
+                             precision_recall_fscore_support, confusion_matrix)
 import joblib
 import os
 from datetime import datetime
@@ -11,14 +11,17 @@ from datetime import datetime
 class CropRecommendationModel:
     def __init__(self):
         self.model = RandomForestClassifier(n_estimators=100, random_state=42)
-        self.scaler = StandardScaler()
         self.feature_names = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
         self.target_name = 'label'
         
     def load_data(self, file_path):
         """Load and prepare the dataset"""
         try:
-            self.data = pd.read_csv(file_path)
+            # Prefer the multithreaded Arrow parser, fall back to the C parser
+            try:
+                self.data = pd.read_csv(file_path, engine='pyarrow', dtype_backend='pyarrow')
+            except (ImportError, TypeError):
+                self.data = pd.read_csv(file_path)
             print("✅ Dataset loaded successfully!")
             print(f"📊 Dataset shape: {self.data.shape}")
             print(f"📋 Columns: {list(self.data.columns)}")
@@ -61,9 +64,11 @@ class CropRecommendationModel:
     
     def prepare_data(self, test_size=0.2, validation_size=0.1):
         """Split data into train, validation, and test sets"""
-        # Separate features and target
-        X = self.data[self.feature_names]
-        y = self.data[self.target_name]
+        # Separate features and target, materialized once as numpy arrays.
+        # The tree builder works on C-contiguous float32, so hand it exactly
+        # that and avoid hidden conversion copies during fit.
+        X = np.ascontiguousarray(self.data[self.feature_names].to_numpy(dtype=np.float32, copy=False))
+        y = self.data[self.target_name].to_numpy()
         
         # First split: separate test set
         X_temp, X_test, y_temp, y_test = train_test_split(
@@ -81,12 +86,8 @@ class CropRecommendationModel:
         print(f"   • Validation set: {X_val.shape[0]} samples ({X_val.shape[0]/len(self.data)*100:.1f}%)")
         print(f"   • Test set: {X_test.shape[0]} samples ({X_test.shape[0]/len(self.data)*100:.1f}%)")
         
-        # Scale features
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        X_val_scaled = self.scaler.transform(X_val)
-        X_test_scaled = self.scaler.transform(X_test)
-        
-        return (X_train_scaled, X_val_scaled, X_test_scaled, 
+        # No scaling: tree splits are invariant to per-feature affine transforms
+        return (X_train, X_val, X_test, 
                 y_train, y_val, y_test)
     
     def train_model(self, X_train, y_train):
@@ -95,11 +96,17 @@ class CropRecommendationModel:
         print("🚀 TRAINING MODEL")
         print("="*60)
         
+        assert X_train.flags['C_CONTIGUOUS'] and X_train.dtype == np.float32, \
+            "prepare_data() should return a C-contiguous float32 training matrix"
+        
         print("⏳ Training Random Forest Classifier...")
         self.model.fit(X_train, y_train)
         print("✅ Model training completed!")
         
-        # Feature importance
+        # Drop the weakest trees so predict/predict_proba walk half the forest
+        self.prune_forest(X_train, y_train)
+        
+        # Feature importance of the forest that is actually saved
         feature_importance = pd.DataFrame({
             'feature': self.feature_names,
             'importance': self.model.feature_importances_
@@ -111,6 +118,35 @@ class CropRecommendationModel:
         
         return feature_importance
     
+    def prune_forest(self, X_train, y_train, keep=50):
+        """Keep only the trees most accurate on their out-of-bag rows
+        
+        Each tree is scored on the training rows its bootstrap sample left
+        out, so the validation and test sets stay unseen.
+        """
+        n_trees = len(self.model.estimators_)
+        if keep >= n_trees:
+            return n_trees
+        
+        n_samples = X_train.shape[0]
+        y_train = np.asarray(y_train)
+        tree_scores = np.empty(n_trees)
+        for i, (est, in_bag) in enumerate(zip(self.model.estimators_, self.model.estimators_samples_)):
+            oob_mask = np.ones(n_samples, dtype=bool)
+            oob_mask[in_bag] = False
+            oob = np.flatnonzero(oob_mask)
+            # Trees predict encoded class indices, map them back to labels
+            predicted = self.model.classes_.take(est.predict(X_train[oob]).astype(np.intp))
+            tree_scores[i] = np.mean(predicted == y_train[oob]) if len(oob) else 0.0
+        kept_idx = np.argsort(tree_scores)[::-1][:keep]
+        
+        self.model.estimators_ = [self.model.estimators_[i] for i in kept_idx]
+        self.model.n_estimators = len(self.model.estimators_)
+        
+        print(f"\n✂️  Forest pruned: kept {self.model.n_estimators}/{n_trees} trees")
+        print(f"   • Mean out-of-bag tree accuracy (kept): {tree_scores[kept_idx].mean():.4f}")
+        return self.model.n_estimators
+    
     def validate_model(self, X_val, y_val):
         """Validate model on validation set"""
         print("\n" + "="*60)
@@ -148,16 +184,17 @@ class CropRecommendationModel:
         # Make predictions
         y_test_pred = self.model.predict(X_test)
         
-        # Calculate comprehensive metrics
-        test_accuracy = accuracy_score(y_test, y_test_pred)
-        test_precision = precision_score(y_test, y_test_pred, average='weighted')
-        test_recall = recall_score(y_test, y_test_pred, average='weighted')
-        test_f1 = f1_score(y_test, y_test_pred, average='weighted')
+        # Per-class metrics in one pass (aligned with self.model.classes_)
+        classes = self.model.classes_
+        precision_per_class, recall_per_class, f1_per_class, support = precision_recall_fscore_support(
+            y_test, y_test_pred, labels=classes, average=None, zero_division=0
+        )
         
-        # Per-class metrics
-        precision_per_class = precision_score(y_test, y_test_pred, average=None)
-        recall_per_class = recall_score(y_test, y_test_pred, average=None)
-        f1_per_class = f1_score(y_test, y_test_pred, average=None)
+        # Weighted averages straight from the per-class arrays
+        test_accuracy = accuracy_score(y_test, y_test_pred)
+        test_precision = np.average(precision_per_class, weights=support)
+        test_recall = np.average(recall_per_class, weights=support)
+        test_f1 = np.average(f1_per_class, weights=support)
         
         print(f"🏆 FINAL TEST RESULTS:")
         print(f"   • Accuracy:  {test_accuracy:.4f} ({test_accuracy*100:.2f}%)")
@@ -166,21 +203,14 @@ class CropRecommendationModel:
         print(f"   • F1-Score:  {test_f1:.4f} ({test_f1*100:.2f}%)")
         
         # Confusion Matrix
-        cm = confusion_matrix(y_test, y_test_pred)
-        
-        print(f"\n📋 Detailed Classification Report:")
-        report = classification_report(y_test, y_test_pred, output_dict=True)
-        
-        # Show top performing crops
-        crop_scores = []
-        for crop in report.keys():
-            if crop not in ['accuracy', 'macro avg', 'weighted avg']:
-                f1 = report[crop]['f1-score']
-                crop_scores.append((crop, f1))
-        
-        crop_scores.sort(key=lambda x: x[1], reverse=True)
-        print(f"🌾 Top 5 Best Predicted Crops:")
-        for i, (crop, f1) in enumerate(crop_scores[:5], 1):
+        cm = confusion_matrix(y_test, y_test_pred, labels=classes)
+        
+        # Show top performing crops straight from the per-class F1 array
+        top_n = min(5, len(f1_per_class))
+        top_idx = np.argpartition(f1_per_class, -top_n)[-top_n:]
+        order = top_idx[np.argsort(f1_per_class[top_idx])[::-1]]
+        print(f"\n🌾 Top 5 Best Predicted Crops:")
+        for i, (crop, f1) in enumerate(zip(classes[order], f1_per_class[order]), 1):
             print(f"   {i}. {crop.capitalize()}: F1={f1:.4f}")
         
         return {
@@ -191,6 +221,7 @@ class CropRecommendationModel:
             'precision_per_class': precision_per_class,
             'recall_per_class': recall_per_class,
             'f1_per_class': f1_per_class,
+            'classes': classes,
             'confusion_matrix': cm,
             'y_true': y_test,
             'y_pred': y_test_pred
@@ -286,28 +317,30 @@ class CropRecommendationModel:
             print(f"   • Experiment with different algorithms")
             print(f"   • Validate with agricultural experts")
     
-    def save_model(self, model_dir="ml_models"):
-        """Save the trained model and scaler"""
+    def save_model(self, model_dir="ml_models", compress=3):
+        """Save the trained model"""
         os.makedirs(model_dir, exist_ok=True)
         
         model_path = os.path.join(model_dir, 'crop_recommendation_model.joblib')
         scaler_path = os.path.join(model_dir, 'feature_scaler.joblib')
         
-        joblib.dump(self.model, model_path)
-        joblib.dump(self.scaler, scaler_path)
+        # Tree node arrays compress well
+        joblib.dump(self.model, model_path, compress=compress)
+        
+        # A stale scaler would be applied to this unscaled model at load time
+        if os.path.exists(scaler_path):
+            os.remove(scaler_path)
         
         print(f"\n💾 MODEL SAVED SUCCESSFULLY!")
         print(f"   📁 Model: {model_path}")
-        print(f"   📁 Scaler: {scaler_path}")
     
     def predict_crop(self, n, p, k, temperature, humidity, ph, rainfall):
         """Predict crop recommendation for given parameters"""
         features = np.array([[n, p, k, temperature, humidity, ph, rainfall]])
-        features_scaled = self.scaler.transform(features)
         
         # Get prediction and probability
-        prediction = self.model.predict(features_scaled)[0]
-        probabilities = self.model.predict_proba(features_scaled)[0]
+        prediction = self.model.predict(features)[0]
+        probabilities = self.model.predict_proba(features)[0]
         
         # Get top 5 recommendations
         class_names = self.model.classes_
@@ -0,0 +1,42 @@
+"""
+Label encoders used by the fertilizer training pipeline and predictor
+"""
+import numpy as np
+import pandas as pd
+
+class HashLabelEncoder:
+    """Drop-in LabelEncoder replacement backed by pandas hash tables
+    
+    Fitting is a single pd.factorize pass instead of np.unique +
+    np.searchsorted; transform is an Index.get_indexer hash lookup. Only the
+    uniques are sorted, so the codes match what sklearn's LabelEncoder
+    would produce.
+    """
+    
+    def __init__(self):
+        self.classes_ = None
+        self._uniques = None
+    
+    def fit(self, values):
+        """Learn the sorted set of categories"""
+        self.fit_transform(values)
+        return self
+    
+    def fit_transform(self, values):
+        """Learn the categories and return the integer codes"""
+        codes, uniques = pd.factorize(values, sort=True)
+        self._uniques = pd.Index(uniques)
+        self.classes_ = np.asarray(uniques, dtype=object)
+        return codes.astype(np.int32)
+    
+    def transform(self, values):
+        """Map categories to integer codes"""
+        codes = self._uniques.get_indexer(pd.Index(values))
+        if (codes < 0).any():
+            unseen = np.asarray(values, dtype=object)[codes < 0][0]
+            raise ValueError(f"y contains previously unseen labels: {unseen!r}")
+        return codes.astype(np.int32)
+    
+    def inverse_transform(self, codes):
+        """Map integer codes back to categories"""
+        return self.classes_[np.asarray(codes, dtype=np.intp)]
@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import os
 
 class FertilizerDetails:
@@ -8,51 +9,58 @@ class FertilizerDetails:
             # Use absolute path relative to this script
             base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             dataset_path = os.path.join(base_dir, 'datasets', 'fertilizer_recommendation_dataset.csv')
-        self.df = pd.read_csv(dataset_path)
+        # Prefer the multithreaded Arrow parser, fall back to the C parser
+        try:
+            self.df = pd.read_csv(dataset_path, engine='pyarrow', dtype_backend='pyarrow')
+        except (ImportError, TypeError):
+            self.df = pd.read_csv(dataset_path)
         self.fertilizer_info = self._build_fertilizer_database()
     
     def _build_fertilizer_database(self):
         """Build a database of fertilizer information"""
-        fertilizer_db = {}
+        # Aggregate every fertilizer in one groupby pass
+        groups = self.df.groupby('Fertilizer', sort=False)
+        grouped = groups.agg(
+            avg_nitrogen=('Nitrogen', 'mean'),
+            avg_phosphorous=('Phosphorous', 'mean'),
+            avg_potassium=('Potassium', 'mean'),
+            avg_temp=('Temperature', 'mean'),
+            avg_ph=('PH', 'mean')
+        )
+        
+        # Most common remark for each fertilizer
+        remarks = groups['Remark'].agg(
+            lambda r: r.mode().iat[0] if r.notna().any() else "General purpose fertilizer"
+        )
+        
+        # Effectiveness from nutrient totals, use case from pH then temperature
+        total = (grouped['avg_nitrogen'].to_numpy() + grouped['avg_phosphorous'].to_numpy()
+                 + grouped['avg_potassium'].to_numpy())
+        effectiveness = np.select([total > 200, total > 120], ['High', 'Medium'], default='Low')
+        
+        avg_ph = grouped['avg_ph'].to_numpy()
+        avg_temp = grouped['avg_temp'].to_numpy()
+        use_case = np.select(
+            [avg_ph < 5.5, avg_ph > 7.5, avg_temp > 30],
+            ["Best for acidic soils", "Best for alkaline soils", "Suitable for warm climate"],
+            default="General purpose application"
+        )
         
-        for fertilizer in self.df['Fertilizer'].unique():
-            fert_data = self.df[self.df['Fertilizer'] == fertilizer]
-            
-            # Get common remark for this fertilizer
-            remarks = fert_data['Remark'].mode()
-            remark = remarks[0] if len(remarks) > 0 else "General purpose fertilizer"
-            
-            # Calculate average nutrient requirements
-            avg_nitrogen = fert_data['Nitrogen'].mean()
-            avg_phos = fert_data['Phosphorous'].mean()
-            avg_pot = fert_data['Potassium'].mean()
-            
-            # Determine effectiveness based on nutrient balance
-            effectiveness = self._calculate_effectiveness(avg_nitrogen, avg_phos, avg_pot)
-            
+        fertilizer_db = {}
+        for i, fertilizer in enumerate(grouped.index):
             fertilizer_db[fertilizer] = {
                 'name': fertilizer,
-                'remark': remark,
-                'effectiveness': effectiveness,
-                'avg_nitrogen': avg_nitrogen,
-                'avg_phosphorous': avg_phos,
-                'avg_potassium': avg_pot,
+                'remark': remarks[fertilizer],
+                'effectiveness': str(effectiveness[i]),
+                'avg_nitrogen': grouped['avg_nitrogen'].iat[i],
+                'avg_phosphorous': grouped['avg_phosphorous'].iat[i],
+                'avg_potassium': grouped['avg_potassium'].iat[i],
                 'dosage': self._calculate_dosage(fertilizer),
-                'use_case': self._determine_use_case(fert_data)
+                'use_case': str(use_case[i])
             }
         
         return fertilizer_db
     
-    def _calculate_effectiveness(self, n, p, k):
-        """Calculate effectiveness percentage"""
-        total = n + p + k
-        if total > 200:
-            return "High"
-        elif total > 120:
-            return "Medium"
-        else:
-            return "Low"
-    
     def _calculate_dosage(self, fertilizer):
         """Calculate recommended dosage"""
         dosage_map = {
@@ -70,20 +78,6 @@ class FertilizerDetails:
         }
         return dosage_map.get(fertilizer, '20-40 kg/acre')
     
-    def _determine_use_case(self, fert_data):
-        """Determine best use case"""
-        avg_temp = fert_data['Temperature'].mean()
-        avg_ph = fert_data['PH'].mean()
-        
-        if avg_ph < 5.5:
-            return "Best for acidic soils"
-        elif avg_ph > 7.5:
-            return "Best for alkaline soils"
-        elif avg_temp > 30:
-            return "Suitable for warm climate"
-        else:
-            return "General purpose application"
-    
     def get_details(self, fertilizer_name):
         """Get details for a specific fertilizer"""
         return self.fertilizer_info.get(fertilizer_name, {
@@ -0,0 +1,93 @@
+"""
+Shared helpers for serving the trained crop and fertilizer forests
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Rows x trees above which scoring is split across threads by hand
+PARALLEL_MIN_WORK = 50_000
+
+def compile_forest(model):
+    """Compile a fitted tree ensemble with Hummingbird, or return None"""
+    try:
+        from hummingbird.ml import convert
+    except ImportError:
+        return None
+    
+    try:
+        compiled = convert(model, 'torch')
+        print("✅ Forest compiled with Hummingbird for tensor inference")
+        return compiled
+    except Exception as e:
+        print(f"⚠️ Hummingbird conversion failed, using sklearn: {e}")
+        return None
+
+def row_buffer(local, width):
+    """Return this thread's preallocated (1, width) float32 input row"""
+    buf = getattr(local, 'buf', None)
+    if buf is None:
+        buf = local.buf = np.empty((1, width), dtype=np.float32)
+    return buf
+
+def top_k_indices(probabilities, k=6):
+    """Indices of the k highest probabilities per row, best first
+    
+    Ties among the selected classes go to the lower index, as in argmax.
+    """
+    k = min(k, probabilities.shape[-1])
+    # Partial selection: only the k candidates are ordered
+    idx = np.argpartition(-probabilities, k - 1, axis=-1)[..., :k]
+    vals = np.take_along_axis(probabilities, idx, axis=-1)
+    # lexsort's last key is the primary one: score descending, then index
+    order = np.lexsort((idx, -vals), axis=-1)
+    return np.take_along_axis(idx, order, axis=-1)
+
+def forest_predict_proba(model, X):
+    """predict_proba that fans large batches out across trees in a thread pool
+    
+    Fitted models may carry n_jobs=1 (or None), in which case sklearn walks
+    every tree on one core. Tree traversal releases the GIL, so summing
+    per-tree probabilities over chunks of estimators scales with cores.
+    """
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None:
+        # Boosted models score all stages in one native pass
+        return model.predict_proba(X)
+    n_workers = min(os.cpu_count() or 1, len(estimators))
+    if n_workers < 2 or len(X) * len(estimators) <= PARALLEL_MIN_WORK:
+        return model.predict_proba(X)
+    
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    
+    def partial_sum(indices):
+        total = np.zeros((X.shape[0], model.n_classes_), dtype=np.float64)
+        for i in indices:
+            total += estimators[i].predict_proba(X)
+        return total
+    
+    chunks = np.array_split(np.arange(len(estimators)), n_workers)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        parts = list(executor.map(partial_sum, chunks))
+    return sum(parts) / len(estimators)
+
+class ForestScorer:
+    """predict_proba through the Hummingbird-compiled forest, else sklearn
+    
+    A compiled model that fails once is dropped for good and scoring
+    continues with forest_predict_proba.
+    """
+    def __init__(self, model, name):
+        self.model = model
+        self.name = name
+        self.compiled = compile_forest(model)
+    
+    def predict_proba(self, X):
+        if self.compiled is not None:
+            try:
+                return self.compiled.predict_proba(X)
+            except Exception as e:
+                print(f"⚠️ Compiled {self.name} model failed, using sklearn: {e}")
+                self.compiled = None
+        return forest_predict_proba(self.model, X)
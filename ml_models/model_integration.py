@@ -1,10 +1,25 @@
 import os
+import functools
+import threading
+import numpy as np
+from ml_models.inference_utils import ForestScorer, row_buffer, top_k_indices
+
+INPUT_FIELDS = ['nitrogen', 'phosphorus', 'potassium', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Probabilities above 0.4 are Medium priority, above 0.7 High
+PRIORITY_THRESHOLDS = (0.4, 0.7)
+PRIORITY_LABELS = ('Low', 'Medium', 'High')
 
 class CropPredictor:
     def __init__(self, model_dir="ml_models"):
         self.model = None
         self.scaler = None
+        self.scorer = None
+        self.simple_model = None
         self.use_sklearn = False
+        # Memoize scoring on rounded inputs; repeated farmer queries are common
+        self._cached_scores = functools.lru_cache(maxsize=4096)(self._score)
+        self._local = threading.local()
         self.load_model()
     
     def load_model(self):
@@ -17,11 +32,14 @@ class CropPredictor:
             model_path = os.path.join(base_dir, 'crop_recommendation_model.joblib')
             scaler_path = os.path.join(base_dir, 'feature_scaler.joblib')
             
-            if os.path.exists(model_path) and os.path.exists(scaler_path):
+            if os.path.exists(model_path):
                 self.model = joblib.load(model_path)
-                self.scaler = joblib.load(scaler_path)
+                # Only models trained before scaling was dropped ship a scaler
+                if os.path.exists(scaler_path):
+                    self.scaler = joblib.load(scaler_path)
                 self.use_sklearn = True
                 print("✅ Sklearn model loaded successfully!")
+                self.scorer = ForestScorer(self.model, 'crop')
                 return True
         except ImportError:
             print("⚠️ Sklearn not available, using simple model")
@@ -38,34 +56,53 @@ class CropPredictor:
             print(f"❌ Error loading simple model: {e}")
             return False
     
+    def _prepare(self, features):
+        """Apply the legacy scaler if the loaded model was trained with one"""
+        if self.scaler is None:
+            return features
+        return self.scaler.transform(features)
+    
+    def _build_result(self, probabilities, top_idx, input_parameters):
+        """Format the top-ranked classes of one probability row"""
+        class_names = self.model.classes_[top_idx]
+        top_probs = probabilities[top_idx]
+        tiers = np.searchsorted(PRIORITY_THRESHOLDS, top_probs)
+        
+        crop_probabilities = [{
+            'name': crop.capitalize(),
+            'probability': float(prob),
+            'confidence_percentage': float(prob * 100),
+            'priority': PRIORITY_LABELS[tier]
+        } for crop, prob, tier in zip(class_names, top_probs, tiers)]
+        
+        return {
+            'recommended_crop': class_names[0].capitalize(),
+            'top_recommendations': crop_probabilities,
+            'input_parameters': input_parameters
+        }
+    
+    def _score(self, key):
+        """Score one rounded input tuple; wrapped by the per-instance LRU cache"""
+        # Reuse this thread's (1, 7) row instead of allocating per request
+        features = row_buffer(self._local, len(INPUT_FIELDS))
+        features[0, :] = key
+        probabilities = self.scorer.predict_proba(self._prepare(features))[0]
+        result = self._build_result(probabilities, top_k_indices(probabilities, 6), None)
+        return result['recommended_crop'], tuple(result['top_recommendations'])
+    
     def predict_crop_recommendation(self, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall):
         """Predict crop recommendation using available model"""
         try:
-            if self.use_sklearn and self.model and self.scaler:
-                # Use sklearn model
-                import numpy as np
-                features = np.array([[nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall]])
-                features_scaled = self.scaler.transform(features)
-                
-                prediction = self.model.predict(features_scaled)[0]
-                probabilities = self.model.predict_proba(features_scaled)[0]
-                
-                class_names = self.model.classes_
-                crop_probabilities = []
-                
-                for crop, prob in zip(class_names, probabilities):
-                    crop_probabilities.append({
-                        'name': crop.capitalize(),
-                        'probability': float(prob),
-                        'confidence_percentage': float(prob * 100),
-                        'priority': 'High' if prob > 0.7 else 'Medium' if prob > 0.4 else 'Low'
-                    })
-                
-                crop_probabilities.sort(key=lambda x: x['probability'], reverse=True)
+            if self.use_sklearn and self.model:
+                # Use sklearn model (cached on inputs rounded to sensor precision)
+                key = (round(float(nitrogen), 1), round(float(phosphorus), 1), round(float(potassium), 1),
+                       round(float(temperature), 1), round(float(humidity), 1), round(float(ph), 2),
+                       round(float(rainfall)))
+                recommended_crop, top_recommendations = self._cached_scores(key)
                 
                 return {
-                    'recommended_crop': prediction.capitalize(),
-                    'top_recommendations': crop_probabilities[:6],
+                    'recommended_crop': recommended_crop,
+                    'top_recommendations': [dict(rec) for rec in top_recommendations],
                     'input_parameters': {
                         'nitrogen': nitrogen,
                         'phosphorus': phosphorus,
@@ -76,27 +113,55 @@ class CropPredictor:
                         'rainfall': rainfall
                     }
                 }
-            else:
+            elif self.simple_model is not None:
                 # Use simple rule-based model
                 return self.simple_model.predict_crop_recommendation(
                     nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall
                 )
+            else:
+                # No model loaded at all; skip straight to the static fallback
+                return self._fallback_result(
+                    nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall
+                )
                 
         except Exception as e:
             print(f"Error in prediction: {e}")
-            # Return fallback recommendation
-            return {
-                'recommended_crop': 'Rice',
-                'top_recommendations': [
-                    {'name': 'Rice', 'probability': 0.85, 'confidence_percentage': 85, 'priority': 'High'},
-                    {'name': 'Wheat', 'probability': 0.70, 'confidence_percentage': 70, 'priority': 'Medium'},
-                    {'name': 'Maize', 'probability': 0.60, 'confidence_percentage': 60, 'priority': 'Medium'},
-                ],
-                'input_parameters': {
-                    'nitrogen': nitrogen, 'phosphorus': phosphorus, 'potassium': potassium,
-                    'temperature': temperature, 'humidity': humidity, 'ph': ph, 'rainfall': rainfall
-                }
+            return self._fallback_result(
+                nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall
+            )
+    
+    def _fallback_result(self, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall):
+        """Static recommendation used when no model can score the input"""
+        return {
+            'recommended_crop': 'Rice',
+            'top_recommendations': [
+                {'name': 'Rice', 'probability': 0.85, 'confidence_percentage': 85, 'priority': 'High'},
+                {'name': 'Wheat', 'probability': 0.70, 'confidence_percentage': 70, 'priority': 'Medium'},
+                {'name': 'Maize', 'probability': 0.60, 'confidence_percentage': 60, 'priority': 'Medium'},
+            ],
+            'input_parameters': {
+                'nitrogen': nitrogen, 'phosphorus': phosphorus, 'potassium': potassium,
+                'temperature': temperature, 'humidity': humidity, 'ph': ph, 'rainfall': rainfall
             }
+        }
+
+    def predict_batch(self, X):
+        """Predict recommendations for an (N, 7) array of inputs in one pass
+        
+        Columns follow INPUT_FIELDS. Forest scoring runs once for the whole
+        batch; the per-row loop only formats results.
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(INPUT_FIELDS))
+        
+        if not (self.use_sklearn and self.model):
+            return [self.predict_crop_recommendation(*row) for row in X.tolist()]
+        
+        probabilities = self.scorer.predict_proba(self._prepare(X))
+        top_idx = top_k_indices(probabilities, 6)
+        return [
+            self._build_result(probs, idx, dict(zip(INPUT_FIELDS, row)))
+            for row, probs, idx in zip(X.tolist(), probabilities, top_idx)
+        ]
 
 # Global predictor instance
 crop_predictor = CropPredictor()
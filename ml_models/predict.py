@@ -1,8 +1,10 @@
 import joblib
 import numpy as np
-import pandas as pd
 import os
+import functools
+import threading
 from get_fertilizer_details import get_fertilizer_details
+from inference_utils import ForestScorer, row_buffer, top_k_indices
 
 class FertilizerPredictor:
     def __init__(self, model_dir=None):
@@ -16,6 +18,9 @@ class FertilizerPredictor:
         self.label_encoders = None
         self.target_encoder = None
         self.scaler = None
+        self.scorer = None
+        # Memoize predictions on rounded inputs; repeated farmer queries are common
+        self._cached_predict = functools.lru_cache(maxsize=4096)(self._predict_row)
         self.load_model()
     
     def load_model(self):
@@ -25,83 +30,125 @@ class FertilizerPredictor:
             self.label_encoders = joblib.load(f'{self.model_dir}/label_encoders.pkl')
             self.target_encoder = joblib.load(f'{self.model_dir}/target_encoder.pkl')
             self.scaler = joblib.load(f'{self.model_dir}/scaler.pkl')
+            
+            # Precompute lookups so predict() avoids pandas and LabelEncoder
+            self._enc = {
+                col: {c: i for i, c in enumerate(le.classes_)}
+                for col, le in self.label_encoders.items()
+            }
+            self.target_classes = self.target_encoder.classes_
+            self._mean = self.scaler.mean_.astype(np.float32)
+            self._scale = self.scaler.scale_.astype(np.float32)
+            self._local = threading.local()
             print("✓ Fertilizer model loaded successfully!")
+            self.scorer = ForestScorer(self.model, 'fertilizer')
         except Exception as e:
             print(f"✗ Error loading model: {str(e)}")
             raise
     
+    def _encode(self, col, value):
+        """Map a category to its label code with a dict lookup"""
+        code = self._enc[col].get(value)
+        if code is None:
+            # Unknown category: defer to LabelEncoder for its usual error
+            code = self.label_encoders[col].transform([value])[0]
+        return code
+    
+    def _predict_row(self, key):
+        """Score one rounded input tuple; wrapped by the per-instance LRU cache"""
+        # Fill the per-thread row buffer: 8 scaled numerical + 2 encoded categorical
+        buf = row_buffer(self._local, 10)
+        row = buf[0]
+        row[:8] = key[:8]
+        row[:8] -= self._mean
+        row[:8] /= self._scale
+        row[8] = self._encode('Soil', key[8])
+        row[9] = self._encode('Crop', key[9])
+        
+        # Make prediction (predict() is just the argmax of predict_proba)
+        probabilities = self.scorer.predict_proba(buf)[0]
+        return self._build_result(probabilities, top_k_indices(probabilities, 6))
+    
     def predict(self, temperature, moisture, rainfall, ph, nitrogen, 
                 phosphorous, potassium, carbon, soil, crop):
         """Predict fertilizer recommendation"""
         try:
-            # Prepare input data
-            input_data = pd.DataFrame({
-                'Temperature': [float(temperature)],
-                'Moisture': [float(moisture)],
-                'Rainfall': [float(rainfall)],
-                'PH': [float(ph)],
-                'Nitrogen': [float(nitrogen)],
-                'Phosphorous': [float(phosphorous)],
-                'Potassium': [float(potassium)],
-                'Carbon': [float(carbon)],
-                'Soil': [soil],
-                'Crop': [crop]
-            })
-            
-            # Encode categorical features
-            for col in ['Soil', 'Crop']:
-                if col in self.label_encoders:
-                    input_data[col] = self.label_encoders[col].transform(input_data[col])
-            
-            # Scale numerical features
-            numerical_cols = ['Temperature', 'Moisture', 'Rainfall', 'PH', 
-                              'Nitrogen', 'Phosphorous', 'Potassium', 'Carbon']
-            input_data[numerical_cols] = self.scaler.transform(input_data[numerical_cols])
-            
-            # Make prediction
-            prediction = self.model.predict(input_data)
-            fertilizer = self.target_encoder.inverse_transform(prediction)[0]
-            
-            # Get prediction probabilities
-            probabilities = self.model.predict_proba(input_data)[0]
-            top_n_idx = np.argsort(probabilities)[-6:][::-1]
-            top_n_fertilizers = self.target_encoder.inverse_transform(top_n_idx)
-            top_n_probs = probabilities[top_n_idx]
-            
-            # Get detailed information
-            fertilizer_details_db = get_fertilizer_details()
-            
-            # Format results with details
-            recommendations = []
-            for i, (fert, prob) in enumerate(zip(top_n_fertilizers, top_n_probs)):
-                details = fertilizer_details_db.get_details(fert)
-                recommendations.append({
-                    'fertilizer': fert,
-                    'confidence': float(prob * 100),
-                    'rank': i + 1,
-                    'effectiveness': details.get('effectiveness', 'Medium'),
-                    'dosage': details.get('dosage', '20-40 kg/acre'),
-                    'use': details.get('use_case', 'General use'),
-                    'notes': details.get('remark', '')
-                })
+            # Round to sensor precision so near-duplicate queries share a cache entry
+            key = (round(float(temperature), 1), round(float(moisture), 3), round(float(rainfall)),
+                   round(float(ph), 2), round(float(nitrogen), 1), round(float(phosphorous), 1),
+                   round(float(potassium), 1), round(float(carbon), 2), soil, crop)
+            result = self._cached_predict(key)
             
-            main_details = fertilizer_details_db.get_details(fertilizer)
+            # Hand out copies so callers cannot mutate the cached entry
+            return {**result, 'top_recommendations': [dict(rec) for rec in result['top_recommendations']]}
             
+        except Exception as e:
             return {
-                'success': True,
-                'recommended_fertilizer': fertilizer,
-                'confidence': float(probabilities[self.target_encoder.transform([fertilizer])[0]] * 100),
-                'effectiveness': main_details.get('effectiveness', 'Medium'),
-                'dosage': main_details.get('dosage', '20-40 kg/acre'),
-                'notes': main_details.get('remark', ''),
-                'top_recommendations': recommendations
+                'success': False,
+                'error': str(e)
             }
+    
+    def predict_batch(self, X):
+        """Predict recommendations for N rows in one pass
+        
+        Each row is (temperature, moisture, rainfall, ph, nitrogen,
+        phosphorous, potassium, carbon, soil, crop). Scaling and forest
+        scoring run once for the whole batch; the per-row loop only
+        formats results.
+        """
+        try:
+            X = np.asarray(X, dtype=object).reshape(-1, 10)
+            features = np.empty(X.shape, dtype=np.float32)
+            features[:, :8] = X[:, :8].astype(np.float32)
+            features[:, :8] -= self._mean
+            features[:, :8] /= self._scale
+            features[:, 8] = [self._encode('Soil', soil) for soil in X[:, 8]]
+            features[:, 9] = [self._encode('Crop', crop) for crop in X[:, 9]]
+            
+            probabilities = self.scorer.predict_proba(features)
+            top_idx = top_k_indices(probabilities, 6)
+            return [self._build_result(probs, idx) for probs, idx in zip(probabilities, top_idx)]
             
         except Exception as e:
-            return {
+            return [{
                 'success': False,
                 'error': str(e)
-            }
+            } for _ in range(len(X))]
+    
+    def _build_result(self, probabilities, top_n_idx):
+        """Format the top-ranked fertilizers of one probability row"""
+        top_n_fertilizers = self.target_classes[top_n_idx]
+        top_n_probs = probabilities[top_n_idx]
+        fertilizer = top_n_fertilizers[0]
+        
+        # Get detailed information
+        fertilizer_details_db = get_fertilizer_details()
+        
+        # Format results with details
+        recommendations = []
+        for i, (fert, prob) in enumerate(zip(top_n_fertilizers, top_n_probs)):
+            details = fertilizer_details_db.get_details(fert)
+            recommendations.append({
+                'fertilizer': fert,
+                'confidence': float(prob * 100),
+                'rank': i + 1,
+                'effectiveness': details.get('effectiveness', 'Medium'),
+                'dosage': details.get('dosage', '20-40 kg/acre'),
+                'use': details.get('use_case', 'General use'),
+                'notes': details.get('remark', '')
+            })
+        
+        main_details = fertilizer_details_db.get_details(fertilizer)
+        
+        return {
+            'success': True,
+            'recommended_fertilizer': fertilizer,
+            'confidence': float(top_n_probs[0] * 100),
+            'effectiveness': main_details.get('effectiveness', 'Medium'),
+            'dosage': main_details.get('dosage', '20-40 kg/acre'),
+            'notes': main_details.get('remark', ''),
+            'top_recommendations': recommendations
+        }
     
     def get_available_soils(self):
         """Get list of available soil types"""
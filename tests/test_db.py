@@ -0,0 +1,155 @@
+import os
+import threading
+
+import pytest
+
+pytest.importorskip('pymongo')
+pytest.importorskip('dotenv')
+
+from utils import db
+
+
+def test_reader_never_sees_notifications_drop_during_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'DATA_DIR', str(tmp_path))
+    # Small enough that the appends below trigger many compactions
+    monkeypatch.setattr(db, 'TAIL_COMPACT_BYTES', 2048)
+    os.makedirs(tmp_path / 'notifications')
+
+    n_appends = 300
+    done = threading.Event()
+
+    def writer():
+        try:
+            for i in range(n_appends):
+                assert db.add_notification('u1', 'system', f'message {i}')
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    seen = 0
+    while not done.is_set():
+        count = len(db.get_persistent_notifications('u1'))
+        assert count >= seen, f'record count dropped from {seen} to {count}'
+        seen = count
+    thread.join()
+
+    notifications = db.get_persistent_notifications('u1')
+    assert len(notifications) == n_appends
+    assert len({n['message'] for n in notifications}) == n_appends
+
+
+class _FailingExpenses:
+    """expenses collection whose insert_many fails every row with one code"""
+
+    def __init__(self, code):
+        self.code = code
+        self.calls = 0
+
+    def insert_many(self, docs, ordered=True):
+        from pymongo.errors import BulkWriteError
+        self.calls += 1
+        raise BulkWriteError({'writeErrors': [
+            {'index': i, 'code': self.code, 'errmsg': 'failed'} for i in range(len(docs))
+        ]})
+
+
+def _flush_with(monkeypatch, code):
+    expenses = _FailingExpenses(code)
+    monkeypatch.setattr(db, 'db', type('FakeDB', (), {'expenses': expenses})())
+    monkeypatch.setattr(db, 'EXPENSE_RETRY_INTERVAL', 3600)
+    db._expense_queue.append({'_id': 'e1', 'user_id': 'u1'})
+    try:
+        while db._expense_queue:
+            db.flush_expenses()
+    finally:
+        if db._expense_timer is not None:
+            db._expense_timer.cancel()
+            db._expense_timer = None
+    return expenses.calls
+
+
+def test_flush_drops_expense_that_fails_validation(monkeypatch):
+    # 121 is DocumentValidationFailure: retrying cannot help
+    assert _flush_with(monkeypatch, 121) == 1
+    assert not db._expense_attempts
+
+
+def test_flush_retries_transient_failure_a_bounded_number_of_times(monkeypatch):
+    # 91 is ShutdownInProgress
+    assert _flush_with(monkeypatch, 91) == db.EXPENSE_MAX_RETRIES + 1
+    assert not db._expense_attempts
+
+
+class _FakeCollection:
+    """Just enough of a pymongo collection for the local-data replay"""
+
+    def __init__(self, fail=False):
+        self.docs = {}
+        self.fail = fail
+
+    def create_index(self, keys, **options):
+        pass
+
+    def update_one(self, query, update, upsert=False):
+        if not any(d.get('email') == query['email'] for d in self.docs.values()):
+            doc = dict(update['$setOnInsert'])
+            self.docs[doc['_id']] = doc
+
+    def insert_many(self, docs, ordered=True):
+        from pymongo.errors import AutoReconnect
+        if self.fail:
+            raise AutoReconnect('connection lost')
+        for doc in docs:
+            self.docs.setdefault(doc['_id'], doc)
+
+
+class _FakeClient:
+    def __init__(self, fail=False):
+        self.myVirtualDatabase = type('FakeMongoDB', (), {
+            'users': _FakeCollection(),
+            'expenses': _FakeCollection(fail),
+            '__getitem__': lambda self, name: getattr(self, name),
+        })()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _go_local(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(db, 'MONTY_DIR', str(tmp_path / 'monty'))
+    monkeypatch.setattr(db, 'EMAIL_INDEX_FILE', str(tmp_path / 'users_email_index.json'))
+    monkeypatch.setattr(db, 'PHONE_INDEX_FILE', str(tmp_path / 'users_phone_index.json'))
+    monkeypatch.setattr(db, 'client', None)
+    monkeypatch.setattr(db, 'db', db.MockDatabase())
+    monkeypatch.setattr(db, 'db_is_local', True)
+    os.makedirs(tmp_path / 'expenses')
+    db.create_user('Asha', 'asha@example.com', 'hash', '9999999999', 'Kerala', 'Idukki')
+    db.save_expense({'user_id': 'u1', 'amount': 10})
+    db.save_expense({'user_id': 'u1', 'amount': 20})
+
+
+def test_switch_to_mongo_copies_local_users_and_expenses_first(tmp_path, monkeypatch):
+    _go_local(tmp_path, monkeypatch)
+    mongo_client = _FakeClient()
+
+    assert db._use_mongo(mongo_client)
+    mongo_db = mongo_client.myVirtualDatabase
+    assert db.db is mongo_db and not db.db_is_local
+    assert [u['email'] for u in mongo_db.users.docs.values()] == ['asha@example.com']
+    assert sorted(e['amount'] for e in mongo_db.expenses.docs.values()) == [10, 20]
+    # Emptied once stored, so a later replay does not copy them again
+    assert db._read_records(db._user_file('expenses', 'u1')) == []
+
+
+def test_failed_copy_keeps_the_local_database(tmp_path, monkeypatch):
+    _go_local(tmp_path, monkeypatch)
+    local_db = db.db
+    mongo_client = _FakeClient(fail=True)
+
+    assert not db._use_mongo(mongo_client)
+    assert mongo_client.closed
+    assert db.db is local_db and db.db_is_local
+    assert len(db.get_user_expenses('u1')) == 2
@@ -1,12 +1,42 @@
 from datetime import datetime
 import os
 import json
+import re
+import time
+import uuid
+import sys
+import copy
+import atexit
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+from bson import ObjectId
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
 # Load environment variables
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
+# Shape of a MongoDB ObjectId; file-mode ids are UUIDs and never match
+_OID_RE = re.compile(r'^[0-9a-fA-F]{24}$')
+
 # MongoDB Atlas connection string from environment variable
 MONGODB_URI = os.getenv('MONGODB_URI')
 
@@ -23,63 +53,530 @@ EQUIPMENT_FILE = os.path.join(DATA_DIR, 'equipment.json')
 NOTIFICATIONS_FILE = os.path.join(DATA_DIR, 'notifications.json')
 EXPENSES_FILE = os.path.join(DATA_DIR, 'expenses.json')
 
+# Per-user collections live in data/<collection>/<user_id>.json; the shared
+# file each one replaces is only read once to migrate it
+SHARDED_COLLECTIONS = {
+    'fertilizers': FERTILIZERS_FILE,
+    'growing': GROWING_FILE,
+    'notifications': NOTIFICATIONS_FILE,
+    'expenses': EXPENSES_FILE,
+}
+
+# On-disk montydb store used in place of MockDatabase when montydb is installed
+MONTY_DIR = os.path.join(DATA_DIR, 'monty')
+
+# Secondary user indexes: phone -> email and email -> user id
+PHONE_INDEX_FILE = os.path.join(DATA_DIR, 'users_phone_index.json')
+EMAIL_INDEX_FILE = os.path.join(DATA_DIR, 'users_email_index.json')
+
+# Collections whose inserts go to an append-only JSONL tail next to the base file,
+# with the empty value for each; per-user shard files are always lists
+APPEND_LOG_FILES = {
+    FERTILIZERS_FILE: dict,
+    GROWING_FILE: dict,
+    EQUIPMENT_FILE: list,
+    NOTIFICATIONS_FILE: list,
+    EXPENSES_FILE: list,
+}
+
 client = None
 db = None
+# True while db is a local stand-in (MockDatabase or montydb); per-user data
+# then lives in the JSON files rather than in db
+db_is_local = True
+# Guards swapping db/client when a background reconnect succeeds
+_db_lock = threading.Lock()
+
+# Startup connection attempts before falling back to the file-based store
+MONGO_STARTUP_ATTEMPTS = 3
+MONGO_MAX_BACKOFF = 60
+
+# (collection, keys, options) created on connect; each one may fail on its own
+MONGO_INDEXES = [
+    ('users', 'email', {'unique': True}),
+    ('users', 'phone', {}),
+    ('expenses', [('user_id', 1), ('entry_date', -1)], {}),
+    ('notifications', [('user_id', 1), ('created_at', -1)], {}),
+    ('equipment', 'status', {}),
+]
+
+# Expenses are queued and written to MongoDB with one insert_many per batch
+EXPENSE_BATCH_SIZE = 128
+EXPENSE_FLUSH_INTERVAL = 0.5  # seconds
+EXPENSE_RETRY_INTERVAL = 5.0  # seconds after a failed flush
+EXPENSE_MAX_RETRIES = 5
+# Write-error codes that can succeed on retry (shutdown, failover, timeouts);
+# anything else, such as a validation failure, fails the same way every time
+TRANSIENT_WRITE_CODES = {6, 7, 50, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436}
+_expense_queue = []
+# Failed flushes so far per queued expense _id
+_expense_attempts = {}
+_expense_lock = threading.Lock()
+_expense_timer = None
+
+# A JSONL tail is folded into its base file once it grows past this size,
+# since every read re-parses the tail
+TAIL_COMPACT_BYTES = 256 * 1024
+
+# Parsed data files keyed by path, with the mtime they were read at
+_CACHE = {}
+
+def _jloads(raw):
+    """Parse JSON text or bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def _jdumps(obj, pretty=False):
+    """Serialize to UTF-8 JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=str, option=option)
+    if pretty:
+        return json.dumps(obj, indent=2, default=str).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), default=str).encode('utf-8')
+
+def _jload(f):
+    """Load JSON from a file opened in binary mode"""
+    return _jloads(f.read())
+
+def _atomic_write(path, payload):
+    """Replace path with payload so readers never see a half-written file"""
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _copy_records(data):
+    """Copy of a data file's records, one level deep
+    
+    The containers and each record dict are new, so setting a field never
+    reaches the cache; nested values are still shared and must be replaced
+    rather than modified in place.
+    """
+    if isinstance(data, dict):
+        return {key: [dict(record) for record in records] for key, records in data.items()}
+    return [dict(record) for record in data]
+
+def _jdump(path, obj, pretty=False):
+    """Write obj to path as compact JSON and cache the file's contents"""
+    payload = _jdumps(obj, pretty=pretty)
+    try:
+        _atomic_write(path, payload)
+    except Exception:
+        _CACHE.pop(path, None)
+        raise
+    # Cache what was written rather than obj, which the caller still holds
+    _CACHE[path] = (os.stat(path).st_mtime_ns, _jloads(payload))
+
+def _read_cached(path, default=None):
+    """Parsed contents of a data file, re-read only when its mtime changes
+    
+    The returned object is shared with the cache and must not be modified;
+    use _clone first to change it.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return default
+    cached = _CACHE.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        data = _jload(f)
+    _CACHE[path] = (mtime, data)
+    return data
+
+@contextmanager
+def _locked(path):
+    """Hold an exclusive lock on a data file across threads and processes
+    
+    Wrap every read-modify-write of the file in this so concurrent requests
+    cannot overwrite each other's changes. The lock is not re-entrant.
+    """
+    fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ten seconds; keep waiting
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+def _append_jsonl(path, *records):
+    """Append records to the JSONL tail of a data file"""
+    payload = b"".join(_jdumps(obj) + b"\n" for obj in records)
+    # Locked so a compaction cannot drop the tail between its read and delete
+    with _locked(path):
+        with open(path + '.jsonl', 'ab') as f:
+            f.write(payload)
+            tail_size = f.tell()
+        if tail_size > TAIL_COMPACT_BYTES:
+            _write_base(path, _load_with_tail(path))
+
+def _iter_jsonl(path):
+    """Yield the records appended to a data file since its last compaction"""
+    tail = path + '.jsonl'
+    if not os.path.exists(tail):
+        return
+    with open(tail, 'rb') as f:
+        for line in f:
+            try:
+                yield _jloads(line)
+            except ValueError:
+                # Torn last line from an interrupted append
+                continue
+
+def _load_with_tail(path):
+    """Load a data file and merge its JSONL tail into it
+    
+    Returns a copy from _copy_records, so callers may set fields on the
+    records or hand them out.
+    """
+    data = _read_cached(path)
+    if data is None:
+        data = APPEND_LOG_FILES.get(path, list)()
+    else:
+        data = _copy_records(data)
+    
+    for record in _iter_jsonl(path):
+        if isinstance(data, dict):
+            data.setdefault(record.get('user_id'), []).append(record)
+        else:
+            data.append(record)
+    return data
+
+def _read_records(path):
+    """_load_with_tail for a plain read
+    
+    Locked because a compaction replaces the base file and removes the tail
+    in two steps; a reader between them would see records vanish or repeat.
+    """
+    with _locked(path):
+        return _load_with_tail(path)
+
+def _write_base(path, data, pretty=False):
+    """Rewrite a data file in full and drop the tail it now contains"""
+    _jdump(path, data, pretty=pretty)
+    tail = path + '.jsonl'
+    if os.path.exists(tail):
+        os.remove(tail)
+
+def _pop_by_id(items, record_id, key='_id'):
+    """Remove the first record whose key matches, in place; True if found"""
+    for i, item in enumerate(items):
+        if item.get(key) == record_id:
+            items.pop(i)
+            return True
+    return False
+
+def safe_file_op(default):
+    """Log and swallow any error from the wrapped data function
+    
+    The wrapped function returns default (a fresh copy, so callers may
+    modify it) when it raises.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                log.exception("%s failed", fn.__name__)
+                return copy.copy(default)
+        return wrapper
+    return decorator
+
+def _as_object_id(value):
+    """ObjectId for a 24-hex-digit string, anything else unchanged"""
+    if isinstance(value, str) and _OID_RE.match(value):
+        return ObjectId(value)
+    return value
+
+def _user_file(collection, user_id):
+    """Path of one user's file in a sharded collection"""
+    safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', str(user_id))
+    return os.path.join(DATA_DIR, collection, f'{safe_id}.json')
+
+def _shard_files(collection):
+    """Every per-user file in a sharded collection"""
+    shard_dir = os.path.join(DATA_DIR, collection)
+    if not os.path.isdir(shard_dir):
+        return []
+    # A user's file may so far exist only as its JSONL tail
+    names = {name[:-len('.jsonl')] if name.endswith('.jsonl') else name
+             for name in os.listdir(shard_dir)}
+    return [os.path.join(shard_dir, name) for name in sorted(names)
+            if name.endswith('.json')]
+
+def _migrate_to_shards(collection, legacy_path):
+    """Split a shared collection file into per-user files, once"""
+    marker = legacy_path + '.migrated'
+    with _locked(legacy_path):
+        if os.path.exists(marker):
+            return
+        
+        legacy = _load_with_tail(legacy_path)
+        if isinstance(legacy, dict):
+            by_user = legacy
+        else:
+            by_user = {}
+            for record in legacy:
+                by_user.setdefault(record.get('user_id'), []).append(record)
+        
+        moved = 0
+        for user_id, records in by_user.items():
+            if records:
+                _append_jsonl(_user_file(collection, user_id), *records)
+                moved += len(records)
+        
+        # The shared file is left in place as a backup; the marker stops a re-run
+        with open(marker, 'w') as f:
+            f.write(datetime.now().isoformat())
+    if moved:
+        log.info("📦 Moved %s %s records into per-user files", moved, collection)
+
+def _compact(path):
+    """Fold a data file's JSONL tail back into the base file"""
+    if os.path.exists(path + '.jsonl'):
+        with _locked(path):
+            _write_base(path, _load_with_tail(path))
+
+def _rebuild_user_indexes():
+    """Build the phone and email indexes from the users file in one pass"""
+    phone_index, email_index = {}, {}
+    for user_id, user in _read_cached(USERS_FILE, {}).items():
+        email = user.get('email')
+        if email:
+            email_index[email] = user_id
+            if user.get('phone'):
+                phone_index[user['phone']] = email
+    _jdump(PHONE_INDEX_FILE, phone_index)
+    _jdump(EMAIL_INDEX_FILE, email_index)
+
+def _index_user(email, phone, user_id):
+    """Record a new user in the phone and email indexes"""
+    with _locked(EMAIL_INDEX_FILE):
+        email_index = dict(_read_cached(EMAIL_INDEX_FILE, {}))
+        email_index[email] = str(user_id)
+        _jdump(EMAIL_INDEX_FILE, email_index)
+        if phone:
+            phone_index = dict(_read_cached(PHONE_INDEX_FILE, {}))
+            phone_index[phone] = email
+            _jdump(PHONE_INDEX_FILE, phone_index)
 
 def init_db(app):
-    global client, db
+    global client, db, db_is_local
     
     # Create data directory if it doesn't exist
     os.makedirs(DATA_DIR, exist_ok=True)
     
     # Initialize JSON files if they don't exist
-    for file_path in [USERS_FILE, CROPS_FILE, FERTILIZERS_FILE, DISEASES_FILE, GROWING_FILE, EQUIPMENT_FILE, NOTIFICATIONS_FILE]:
+    for file_path in [USERS_FILE, CROPS_FILE, DISEASES_FILE, EQUIPMENT_FILE]:
         if not os.path.exists(file_path):
-            with open(file_path, 'w') as f:
-                if file_path in [EQUIPMENT_FILE, NOTIFICATIONS_FILE]:
-                    json.dump([], f)
-                else:
-                    json.dump({}, f)
+            _jdump(file_path, [] if file_path == EQUIPMENT_FILE else {})
+    
+    if not (os.path.exists(PHONE_INDEX_FILE) and os.path.exists(EMAIL_INDEX_FILE)):
+        try:
+            _rebuild_user_indexes()
+        except Exception as e:
+            log.warning("⚠️ Could not build user indexes: %s", e)
+    
+    shard_files = []
+    for collection, legacy_path in SHARDED_COLLECTIONS.items():
+        os.makedirs(os.path.join(DATA_DIR, collection), exist_ok=True)
+        try:
+            _migrate_to_shards(collection, legacy_path)
+        except Exception as e:
+            log.warning("⚠️ Could not migrate %s: %s", collection, e)
+        shard_files.extend(_shard_files(collection))
     
-    print("✅ File-based database initialized successfully!")
-    print("📁 Data will be stored in the 'data' directory")
+    # Fold appended records from the previous run into the base files
+    for file_path in [EQUIPMENT_FILE] + shard_files:
+        try:
+            _compact(file_path)
+        except Exception as e:
+            log.warning("⚠️ Could not compact %s: %s", os.path.basename(file_path), e)
+    
+    log.info("✅ File-based database initialized successfully!")
+    log.info("📁 Data will be stored in the 'data' directory")
     
     # Try MongoDB Atlas connection as backup (only if URI is configured)
     if MONGODB_URI:
+        log.info("🔄 Attempting MongoDB Atlas connection...")
+        mongo_client = _connect_mongo(MONGODB_URI, attempts=MONGO_STARTUP_ATTEMPTS)
+        if mongo_client is None or not _use_mongo(mongo_client):
+            log.warning("⚠️  Common issues:")
+            log.warning("   1. Check if your IP address is whitelisted in MongoDB Atlas")
+            log.warning("   2. Verify network connectivity and firewall settings")
+            log.warning("   3. Ensure Atlas SQL interface is enabled")
+            log.info("🔧 Using file-based database until MongoDB is reachable")
+            with _db_lock:
+                db, db_is_local = _local_db(), True
+            threading.Thread(target=_reconnect_forever, name='mongo-reconnect', daemon=True).start()
+    else:
+        log.info("🔧 MongoDB disabled - using file-based database")
+        with _db_lock:
+            db, db_is_local = _local_db(), True
+
+def _local_db():
+    """Local stand-in for MongoDB: montydb on disk if installed, else MockDatabase"""
+    try:
+        from montydb import MontyClient
+    except ImportError:
+        return MockDatabase()
+    
+    try:
+        local_db = MontyClient(MONTY_DIR).myVirtualDatabase
+    except Exception as e:
+        log.warning("⚠️ montydb unavailable (%s), using mock database", e)
+        return MockDatabase()
+    
+    try:
+        local_db.users.create_index("email", unique=True)
+    except Exception as e:
+        log.warning("⚠️ Index creation note: %s", e)
+    log.info("📝 Using montydb local database in %s", MONTY_DIR)
+    return local_db
+
+def _connect_mongo(uri, attempts=MONGO_STARTUP_ATTEMPTS):
+    """Connect and ping MongoDB, retrying with exponential backoff
+    
+    Returns the client, or None once every attempt has failed.
+    """
+    for attempt in range(attempts):
+        mongo_client = None
         try:
-            print("🔄 Attempting MongoDB Atlas connection...")
-            client = MongoClient(MONGODB_URI, 
-                               serverSelectionTimeoutMS=30000,
-                               connectTimeoutMS=30000,
-                               socketTimeoutMS=30000,
-                               retryWrites=False)
-            
-            # Use myVirtualDatabase database
-            db = client.myVirtualDatabase
+            mongo_client = MongoClient(uri,
+                                       serverSelectionTimeoutMS=5000,
+                                       connectTimeoutMS=30000,
+                                       socketTimeoutMS=30000,
+                                       retryWrites=False)
             # Test the connection
-            client.admin.command('ping')
-            print("✅ Successfully connected to MongoDB Atlas!")
-            print(f"📊 Using database: myVirtualDatabase")
-            
-            # Create indexes for better performance (if supported)
-            try:
-                db.users.create_index("email", unique=True)
-                print("📊 Database indexes created successfully")
-            except Exception as e:
-                print(f"⚠️ Index creation note: {e}")
-                print("   (This is normal for Atlas SQL interface)")
-                
+            mongo_client.admin.command('ping')
+            return mongo_client
+        except PyMongoError as e:
+            log.error("❌ MongoDB connection attempt %s/%s failed: %s", attempt + 1, attempts, e)
+            # Stop the failed client's monitor threads before trying again
+            if mongo_client is not None:
+                mongo_client.close()
+            if attempt < attempts - 1:
+                time.sleep(min(MONGO_MAX_BACKOFF, 2 ** attempt))
+    return None
+
+def _use_mongo(mongo_client):
+    """Switch the module over to a connected MongoDB client
+    
+    Returns False, leaving the local database in use, when the data saved
+    locally cannot be copied into MongoDB first.
+    """
+    global client, db, db_is_local
+    
+    # Use myVirtualDatabase database
+    mongo_db = mongo_client.myVirtualDatabase
+    log.info("✅ Successfully connected to MongoDB Atlas!")
+    log.info("📊 Using database: myVirtualDatabase")
+    
+    # Create indexes for better performance (if supported)
+    created = 0
+    for collection, keys, options in MONGO_INDEXES:
+        try:
+            mongo_db[collection].create_index(keys, **options)
+            created += 1
         except Exception as e:
-            print(f"❌ MongoDB connection failed: {e}")
-            print("⚠️  Common issues:")
-            print("   1. Check if your IP address is whitelisted in MongoDB Atlas")
-            print("   2. Verify network connectivity and firewall settings")
-            print("   3. Ensure Atlas SQL interface is enabled")
-            print("🔧 Using file-based database for development")
-            db = MockDatabase()
+            log.warning("⚠️ Index creation note (%s): %s", collection, e)
+    if created == len(MONGO_INDEXES):
+        log.info("📊 Database indexes created successfully")
     else:
-        print("🔧 MongoDB disabled - using file-based database")
-        db = MockDatabase()
+        log.warning("   (This is normal for Atlas SQL interface)")
+    
+    with _db_lock:
+        local_db = db
+    if local_db is None and os.path.isdir(MONTY_DIR):
+        # Users an earlier run saved to montydb while MongoDB was down
+        local_db = _local_db()
+    try:
+        _replay_local_data(mongo_db, local_db)
+    except PyMongoError as e:
+        log.warning("⚠️ Could not copy local data into MongoDB, staying on the local database: %s", e)
+        mongo_client.close()
+        return False
+    
+    with _db_lock:
+        client, db, db_is_local = mongo_client, mongo_db, False
+    # Pick up anything saved locally while the copy above was running
+    try:
+        _replay_local_data(mongo_db, local_db)
+    except PyMongoError as e:
+        log.warning("⚠️ Some local data is not in MongoDB yet, copied at next startup: %s", e)
+    return True
+
+def _replay_local_data(mongo_db, local_db):
+    """Copy users and expenses saved while MongoDB was unreachable into it
+    
+    Safe to repeat: users already in MongoDB (by email) and expenses already
+    copied (by _id) are left alone, and an expense file is only emptied once
+    all of it is stored.
+    """
+    if local_db is not None:
+        for user in list(local_db.users.find({})):
+            # Keep the local _id so sessions holding it still resolve
+            mongo_db.users.update_one({'email': user['email']}, {'$setOnInsert': user}, upsert=True)
+    
+    copied = 0
+    for path in _shard_files('expenses'):
+        with _locked(path):
+            # Copies, so a failed insert leaves the cached records untouched
+            expenses = [dict(expense) for expense in _load_with_tail(path)]
+            if not expenses:
+                continue
+            for expense in expenses:
+                _prepare_expense(expense)
+            try:
+                mongo_db.expenses.insert_many(expenses, ordered=False)
+            except BulkWriteError as e:
+                # 11000 (duplicate key): copied by an earlier, interrupted replay
+                if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                    raise
+            _write_base(path, [])
+            copied += len(expenses)
+    if copied:
+        log.info("📤 Copied %d locally saved expenses into MongoDB", copied)
+
+def _reconnect_forever():
+    """Keep retrying MongoDB in the background while the file store is in use"""
+    delay = 1
+    while True:
+        time.sleep(delay)
+        mongo_client = _connect_mongo(MONGODB_URI, attempts=1)
+        if mongo_client is not None and _use_mongo(mongo_client):
+            log.info("🔁 Reconnected to MongoDB Atlas")
+            return
+        delay = min(MONGO_MAX_BACKOFF, delay * 2)
 
 class MockDatabase:
     """Enhanced Mock database for development when MongoDB is not available"""
@@ -88,41 +585,52 @@ class MockDatabase:
         self.crops_data = []
         self.fertilizers_data = []
         self.diseases_data = []
-        print("📝 Mock database initialized with enhanced features")
+        # Built once so each collection's _id lookup table persists
+        self._collections = {
+            'users': MockCollection('users', self.users_data, is_dict=True),
+            'crops': MockCollection('crops', self.crops_data),
+            'fertilizers': MockCollection('fertilizers', self.fertilizers_data),
+            'diseases': MockCollection('diseases', self.diseases_data),
+        }
+        log.info("📝 Mock database initialized with enhanced features")
     
     @property
     def users(self):
-        return MockCollection('users', self.users_data, is_dict=True)
+        return self._collections['users']
     
     @property 
     def crops(self):
-        return MockCollection('crops', self.crops_data)
+        return self._collections['crops']
         
     @property
     def fertilizers(self):
-        return MockCollection('fertilizers', self.fertilizers_data)
+        return self._collections['fertilizers']
         
     @property
     def diseases(self):
-        return MockCollection('diseases', self.diseases_data)
+        return self._collections['diseases']
 
 class MockCollection:
     def __init__(self, name, data_store, is_dict=False):
         self.name = name
         self.data_store = data_store
         self.is_dict = is_dict
+        items = data_store.values() if is_dict else data_store
+        self._by_id = {item['_id']: item for item in items if '_id' in item}
         
-    def find_one(self, query):
+    def find_one(self, query, projection=None):
         if self.is_dict and 'email' in query:
-            return self.data_store.get(query['email'])
+            item = self.data_store.get(query['email'])
         elif '_id' in query:
-            for item in self.data_store:
-                if item.get('_id') == query['_id']:
-                    return item
-        return None
+            item = self._by_id.get(query['_id'])
+        else:
+            return None
+        if item is not None and projection:
+            # Only exclusion projections like {'password': 0} are supported
+            item = {k: v for k, v in item.items() if projection.get(k, 1)}
+        return item
     
     def insert_one(self, data):
-        import uuid
         mock_id = str(uuid.uuid4())
         data['_id'] = mock_id
         
@@ -130,6 +638,7 @@ class MockCollection:
             self.data_store[data['email']] = data
         else:
             self.data_store.append(data)
+        self._by_id[mock_id] = data
             
         return type('MockResult', (), {'inserted_id': mock_id})()
     
@@ -139,16 +648,21 @@ class MockCollection:
         return list(self.data_store) if not self.is_dict else list(self.data_store.values())
     
     def delete_one(self, query):
-        if '_id' in query:
-            self.data_store = [item for item in self.data_store if item.get('_id') != query['_id']]
-            return type('MockResult', (), {'deleted_count': 1})()
-        return type('MockResult', (), {'deleted_count': 0})()
+        item = self._by_id.pop(query['_id'], None) if '_id' in query else None
+        if item is None:
+            return type('MockResult', (), {'deleted_count': 0})()
+        if self.is_dict:
+            self.data_store.pop(item.get('email'), None)
+        else:
+            self.data_store.remove(item)
+        return type('MockResult', (), {'deleted_count': 1})()
     
     def create_index(self, field, unique=False):
-        print(f"Mock index created for {field} (unique: {unique})")
+        log.debug("Mock index created for %s (unique: %s)", field, unique)
 
 def get_db():
-    return db
+    with _db_lock:
+        return db
 
 # User model functions
 def create_user(name, email, password, phone, state, district):
@@ -166,7 +680,11 @@ def create_user(name, email, password, phone, state, district):
         'disease_history': []
     }
     result = users.insert_one(user_data)
-    print(f"👤 User created: {name} ({email})")
+    try:
+        _index_user(email, phone, result.inserted_id)
+    except Exception as e:
+        log.warning("⚠️ Could not update user indexes: %s", e)
+    log.info("👤 User created: %s (%s)", name, email)
     return result
 
 def find_user_by_email(email):
@@ -178,78 +696,63 @@ def find_user_by_email(email):
         user = db.users.find_one({'email': email}) if db else None
     
     if user:
-        print(f"🔍 User found: {email}")
+        log.debug("🔍 User found: %s", email)
     return user
 
 def find_user_by_phone(phone):
     """Find user by phone number"""
     if hasattr(db, 'users'):
         users = db.users
-        # Get all users and search for phone
-        all_users = users.find({})
-        for user in all_users:
-            if user.get('phone') == phone:
-                print(f"🔍 User found with phone: {phone}")
-                return user
+        if isinstance(db, MockDatabase):
+            # Mock users are keyed by email; resolve it through the phone index
+            email = _read_cached(PHONE_INDEX_FILE, {}).get(phone)
+            user = users.find_one({'email': email}) if email else None
+        else:
+            user = users.find_one({'phone': phone})
+        if user:
+            log.debug("🔍 User found with phone: %s", phone)
+            return user
     return None
 
+@safe_file_op(default=False)
 def update_user_password(email, new_password):
     """Update user password by email"""
-    try:
-        # Load users from file
-        with open(USERS_FILE, 'r') as f:
-            users_db = json.load(f)
+    # Jump straight to the user through the email index
+    with _locked(USERS_FILE):
+        user_id = _read_cached(EMAIL_INDEX_FILE, {}).get(email)
+        users_db = {uid: dict(user) for uid, user in _read_cached(USERS_FILE, {}).items()}
+        user = users_db.get(user_id) if user_id else None
         
-        # Find and update user
-        for user_id, user in users_db.items():
-            if user.get('email') == email:
-                user['password'] = new_password
-                # Save back to file
-                with open(USERS_FILE, 'w') as f:
-                    json.dump(users_db, f, indent=2, default=str)
-                print(f"🔐 Password updated for user: {email}")
-                return True
+        if user is None or user.get('email') != email:
+            log.warning("⚠️ User not found: %s", email)
+            return False
         
-        print(f"⚠️ User not found: {email}")
-        return False
-    except Exception as e:
-        print(f"❌ Error updating password: {e}")
-        return False
+        user['password'] = new_password
+        # Save back to file
+        _jdump(USERS_FILE, users_db)
+    log.info("🔐 Password updated for user: %s", email)
+    return True
 
 def find_user_by_id(user_id):
     try:
-        if hasattr(db, 'users') and db:
+        if db is not None and hasattr(db, 'users'):
             users = db.users
             
-            # Try with ObjectId first (for MongoDB)
-            try:
-                from bson.objectid import ObjectId
-                user = users.find_one(
-                    {'_id': ObjectId(user_id)}, 
-                    {'password': 0}  # Exclude password field
-                )
-                if user:
-                    return user
-            except:
-                pass
+            # ObjectId for MongoDB ids, plain string for file-based storage
+            return users.find_one(
+                {'_id': _as_object_id(user_id)},
+                {'password': 0}  # Exclude password field
+            )
             
-            # Try with string ID (for file-based storage)
-            user = users.find_one({'_id': user_id})
-            if user:
-                # Remove password from result
-                user_copy = user.copy()
-                user_copy.pop('password', None)
-                return user_copy
-                
     except Exception as e:
-        print(f"Error fetching user by ID: {e}")
+        log.error("Error fetching user by ID: %s", e)
     
     # If user not found, return None
     return None
 
 # Mock functions for development
 def save_crop_recommendation(user_id, crop_data, timeline_data):
-    print(f"🌱 Crop recommendation saved for user {user_id}: {crop_data['crop_name']}")
+    log.info("🌱 Crop recommendation saved for user %s: %s", user_id, crop_data['crop_name'])
     return type('MockResult', (), {'inserted_id': 'mock_crop_id'})()
 
 def get_user_crops(user_id):
@@ -265,48 +768,30 @@ def get_user_crops(user_id):
     ]
 
 def delete_crop(crop_id):
-    print(f"🗑️ Crop deleted: {crop_id}")
+    log.info("🗑️ Crop deleted: %s", crop_id)
     return type('MockResult', (), {'deleted_count': 1})()
 
+@safe_file_op(default=None)
 def save_fertilizer_recommendation(user_id, fertilizer_data):
     """Save fertilizer recommendation to file"""
-    import uuid
-    try:
-        # Load existing fertilizers
-        with open(FERTILIZERS_FILE, 'r') as f:
-            fertilizer_db = json.load(f)
-        
-        # Generate unique ID
-        fertilizer_id = str(uuid.uuid4())
-        fertilizer_data['_id'] = fertilizer_id
-        fertilizer_data['user_id'] = user_id
-        fertilizer_data['saved_at'] = datetime.utcnow().isoformat()
-        
-        # Save fertilizer
-        if user_id not in fertilizer_db:
-            fertilizer_db[user_id] = []
-        
-        fertilizer_db[user_id].append(fertilizer_data)
-        
-        # Write back to file
-        with open(FERTILIZERS_FILE, 'w') as f:
-            json.dump(fertilizer_db, f, indent=2)
-        
-        print(f"🧪 Fertilizer recommendation saved for user {user_id}: {fertilizer_data.get('name')}")
-        return type('MockResult', (), {'inserted_id': fertilizer_id})()
-    except Exception as e:
-        print(f"Error saving fertilizer: {e}")
-        return None
+    # Generate unique ID
+    fertilizer_id = str(uuid.uuid4())
+    fertilizer_data['_id'] = fertilizer_id
+    fertilizer_data['user_id'] = user_id
+    fertilizer_data['saved_at'] = datetime.utcnow().isoformat()
+    
+    # Append to the log instead of rewriting the whole file
+    _append_jsonl(_user_file('fertilizers', user_id), fertilizer_data)
+    
+    log.info("🧪 Fertilizer recommendation saved for user %s: %s", user_id, fertilizer_data.get('name'))
+    return type('MockResult', (), {'inserted_id': fertilizer_id})()
 
+@safe_file_op(default=[])
 def get_user_fertilizers(user_id):
     """Get user's saved fertilizers from file"""
-    import uuid
-    try:
-        with open(FERTILIZERS_FILE, 'r') as f:
-            fertilizer_db = json.load(f)
-        
-        # Get user's fertilizers
-        user_fertilizers = fertilizer_db.get(user_id, [])
+    path = _user_file('fertilizers', user_id)
+    with _locked(path):
+        user_fertilizers = _load_with_tail(path)
         
         # Add _id to fertilizers that don't have one
         needs_save = False
@@ -317,51 +802,46 @@ def get_user_fertilizers(user_id):
         
         # Save back if we added any IDs
         if needs_save:
-            fertilizer_db[user_id] = user_fertilizers
-            with open(FERTILIZERS_FILE, 'w') as f:
-                json.dump(fertilizer_db, f, indent=2)
+            _write_base(path, user_fertilizers)
         
-        return user_fertilizers
-    except Exception as e:
-        print(f"Error loading fertilizers: {e}")
-        return []
+    return user_fertilizers
 
+@safe_file_op(default=False)
 def delete_fertilizer_recommendation(fertilizer_id, user_id):
     """Delete a fertilizer recommendation from file"""
-    try:
-        # Load existing fertilizers
-        with open(FERTILIZERS_FILE, 'r') as f:
-            fertilizer_db = json.load(f)
-        
-        # Get user's fertilizers
-        user_fertilizers = fertilizer_db.get(user_id, [])
+    # Load the user's fertilizers
+    path = _user_file('fertilizers', user_id)
+    with _locked(path):
+        user_fertilizers = _load_with_tail(path)
         
         # Find and remove the fertilizer
-        initial_count = len(user_fertilizers)
-        user_fertilizers = [f for f in user_fertilizers if f.get('_id') != fertilizer_id]
-        
-        if len(user_fertilizers) < initial_count:
-            # Fertilizer was found and removed
-            fertilizer_db[user_id] = user_fertilizers
-            
+        if _pop_by_id(user_fertilizers, fertilizer_id):
             # Write back to file
-            with open(FERTILIZERS_FILE, 'w') as f:
-                json.dump(fertilizer_db, f, indent=2)
+            _write_base(path, user_fertilizers)
             
-            print(f"🗑️ Successfully deleted fertilizer {fertilizer_id} for user {user_id}")
+            log.info("🗑️ Successfully deleted fertilizer %s for user %s", fertilizer_id, user_id)
             return True
         else:
-            print(f"⚠️ Fertilizer {fertilizer_id} not found for user {user_id}")
+            log.warning("⚠️ Fertilizer %s not found for user %s", fertilizer_id, user_id)
             return False
-            
-    except Exception as e:
-        print(f"Error deleting fertilizer: {e}")
-        return False
 
 def save_disease_detection(user_id, disease_data):
-    print(f"🦠 Disease detection saved for user {user_id}: {disease_data['disease_name']}")
+    log.info("🦠 Disease detection saved for user %s: %s", user_id, disease_data['disease_name'])
     return type('MockResult', (), {'inserted_id': 'mock_disease_id'})()
 
+def save_diseases_bulk(user_id, diseases):
+    """Save several disease detections with a single write"""
+    if not diseases:
+        return []
+    if _uses_mongo():
+        for disease in diseases:
+            disease['user_id'] = user_id
+        result = get_db().diseases.insert_many(diseases, ordered=False)
+        return [str(inserted_id) for inserted_id in result.inserted_ids]
+    
+    log.info("🦠 %s disease detections saved for user %s", len(diseases), user_id)
+    return ['mock_disease_id'] * len(diseases)
+
 def get_user_diseases(user_id):
     # Return some mock data for testing
     return [
@@ -374,44 +854,33 @@ def get_user_diseases(user_id):
         }
     ]
 
+@safe_file_op(default=None)
 def save_growing_activity(activity_data):
     """Save a growing activity to database"""
-    import uuid
+    # Generate unique ID
+    activity_id = str(uuid.uuid4())
+    activity_data['_id'] = activity_id
+    
+    # Epoch seconds so the dashboard can do integer date math
     try:
-        # Load existing activities
-        with open(GROWING_FILE, 'r') as f:
-            growing_data = json.load(f)
-        
-        # Generate unique ID
-        activity_id = str(uuid.uuid4())
-        activity_data['_id'] = activity_id
-        
-        # Save activity
-        user_id = activity_data.get('user_id')
-        if user_id not in growing_data:
-            growing_data[user_id] = []
-        
-        growing_data[user_id].append(activity_data)
-        
-        # Write back to file
-        with open(GROWING_FILE, 'w') as f:
-            json.dump(growing_data, f, indent=2)
-        
-        print(f"🌱 Growing activity saved: {activity_data.get('crop_display_name')} [ID: {activity_id}]")
-        return type('MockResult', (), {'inserted_id': activity_id})()
-    except Exception as e:
-        print(f"Error saving growing activity: {e}")
-        return None
+        created_ts, harvest_ts = _activity_timestamps(activity_data)
+        activity_data['created_ts'] = created_ts
+        activity_data['harvest_ts'] = harvest_ts
+    except (KeyError, TypeError, ValueError):
+        pass
+    
+    # Append to the log instead of rewriting the whole file
+    _append_jsonl(_user_file('growing', activity_data.get('user_id')), activity_data)
+    
+    log.info("🌱 Growing activity saved: %s [ID: %s]", activity_data.get('crop_display_name'), activity_id)
+    return type('MockResult', (), {'inserted_id': activity_id})()
 
+@safe_file_op(default=[])
 def get_user_growing_activities(user_id, status='active'):
     """Get user's growing activities"""
-    import uuid
-    try:
-        with open(GROWING_FILE, 'r') as f:
-            growing_data = json.load(f)
-        
-        # Get user's activities
-        user_activities = growing_data.get(user_id, [])
+    path = _user_file('growing', user_id)
+    with _locked(path):
+        user_activities = _load_with_tail(path)
         
         # Add _id to activities that don't have one
         needs_save = False
@@ -422,139 +891,106 @@ def get_user_growing_activities(user_id, status='active'):
         
         # Save back if we added any IDs
         if needs_save:
-            growing_data[user_id] = user_activities
-            with open(GROWING_FILE, 'w') as f:
-                json.dump(growing_data, f, indent=2)
+            _write_base(path, user_activities)
         
-        # Filter by status if specified
-        if status:
-            user_activities = [a for a in user_activities if a.get('status') == status]
-        
-        return user_activities
-    except Exception as e:
-        print(f"Error loading growing activities: {e}")
-        return []
+    # Filter by status if specified
+    if status:
+        user_activities = [a for a in user_activities if a.get('status') == status]
+    
+    return user_activities
 
+@safe_file_op(default=False)
 def update_growing_activity(activity_id, user_id, update_data):
     """Update growing activity with new data (stage, notes, tasks)"""
-    try:
-        print(f"💾 DB: Updating activity {activity_id} for user {user_id}")
-        print(f"💾 DB: Update data: {update_data}")
-        
-        # Load existing activities
-        with open(GROWING_FILE, 'r') as f:
-            growing_data = json.load(f)
-        
-        print(f"💾 DB: Loaded data for {len(growing_data)} users")
-        
-        # Get user's activities
-        user_activities = growing_data.get(user_id, [])
-        print(f"💾 DB: User has {len(user_activities)} activities")
+    # Load the user's activities
+    path = _user_file('growing', user_id)
+    with _locked(path):
+        user_activities = _load_with_tail(path)
         
         # Find and update the activity
         activity_found = False
-        for i, activity in enumerate(user_activities):
-            print(f"💾 DB: Checking activity {i}: {activity.get('_id')} == {activity_id}?")
+        for activity in user_activities:
             if activity.get('_id') == activity_id or activity.get('id') == activity_id:
-                print(f"💾 DB: Match found! Updating...")
                 # Update the activity fields
-                if 'current_stage' in update_data:
-                    print(f"💾 DB: Updating stage: {activity.get('current_stage')} -> {update_data['current_stage']}")
-                    user_activities[i]['current_stage'] = update_data['current_stage']
-                if 'progress' in update_data:
-                    print(f"💾 DB: Updating progress: {activity.get('progress')} -> {update_data['progress']}")
-                    user_activities[i]['progress'] = update_data['progress']
-                if 'notes' in update_data:
-                    print(f"💾 DB: Updating notes")
-                    user_activities[i]['notes'] = update_data['notes']
-                if 'completed_tasks' in update_data:
-                    print(f"💾 DB: Updating tasks")
-                    user_activities[i]['completed_tasks'] = update_data['completed_tasks']
+                for field in ('current_stage', 'progress', 'notes', 'completed_tasks'):
+                    if field in update_data:
+                        activity[field] = update_data[field]
                 
-                user_activities[i]['updated_at'] = datetime.now().isoformat()
+                activity['updated_at'] = datetime.now().isoformat()
                 activity_found = True
                 break
         
         if activity_found:
-            growing_data[user_id] = user_activities
-            
             # Write back to file
-            with open(GROWING_FILE, 'w') as f:
-                json.dump(growing_data, f, indent=2)
+            _write_base(path, user_activities)
             
-            print(f"✅ Successfully updated activity {activity_id} for user {user_id}")
-            print(f"💾 DB: File saved to {GROWING_FILE}")
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("💾 DB: Updated activity %s for user %s with %s (saved to %s)",
+                          activity_id, user_id, update_data, path)
             return True
         else:
-            print(f"⚠️ Activity {activity_id} not found for user {user_id}")
+            log.warning("⚠️ Activity %s not found for user %s", activity_id, user_id)
             return False
-            
-    except Exception as e:
-        print(f"Error updating activity: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
 
+@safe_file_op(default=False)
 def delete_growing_activity(activity_id, user_id):
     """Delete a growing activity"""
-    try:
-        # Load existing activities
-        with open(GROWING_FILE, 'r') as f:
-            growing_data = json.load(f)
-        
-        # Get user's activities
-        user_activities = growing_data.get(user_id, [])
+    # Load the user's activities
+    path = _user_file('growing', user_id)
+    with _locked(path):
+        user_activities = _load_with_tail(path)
         
         # Find and remove the activity
-        initial_count = len(user_activities)
-        user_activities = [a for a in user_activities if a.get('_id') != activity_id]
-        
-        if len(user_activities) < initial_count:
-            # Activity was found and removed
-            growing_data[user_id] = user_activities
-            
+        if _pop_by_id(user_activities, activity_id):
             # Write back to file
-            with open(GROWING_FILE, 'w') as f:
-                json.dump(growing_data, f, indent=2)
+            _write_base(path, user_activities)
             
-            print(f"🗑️ Successfully deleted activity {activity_id} for user {user_id}")
+            log.info("🗑️ Successfully deleted activity %s for user %s", activity_id, user_id)
             return True
         else:
-            print(f"⚠️ Activity {activity_id} not found for user {user_id}")
+            log.warning("⚠️ Activity %s not found for user %s", activity_id, user_id)
             return False
-            
-    except Exception as e:
-        print(f"Error deleting activity: {e}")
-        return False
+
+def _activity_timestamps(activity):
+    """(created_ts, harvest_ts) epoch seconds, parsed only for older records"""
+    created_ts = activity.get('created_ts')
+    if created_ts is None:
+        created_ts = int(datetime.fromisoformat(activity['created_at']).timestamp())
+    harvest_ts = activity.get('harvest_ts')
+    if harvest_ts is None:
+        harvest_ts = int(datetime.strptime(activity['harvest_date'], '%Y-%m-%d').timestamp())
+    return created_ts, harvest_ts
 
 def get_dashboard_notifications(user_id):
     """Get notifications for dashboard"""
-    from datetime import datetime, timedelta
     notifications = []
     
     # Get active growing activities
     activities = get_user_growing_activities(user_id)
     
+    now_ts = int(time.time())
+    now_str = datetime.fromtimestamp(now_ts).strftime('%Y-%m-%d %H:%M:%S')
+    
     for activity in activities:
+        created_ts, harvest_ts = _activity_timestamps(activity)
+        
         # Check for upcoming tasks
-        start_date = datetime.fromisoformat(activity['created_at'])
-        days_passed = (datetime.now() - start_date).days
-        weeks_passed = days_passed // 7
+        days_passed = (now_ts - created_ts) // 86400
+        current_week = days_passed // 7 + 1
         
         # Find pending tasks for current week
         for task in activity['tasks']:
-            if task['week'] == weeks_passed + 1:
+            if task['week'] == current_week:
                 notifications.append({
                     'type': 'task',
                     'crop': activity['crop_display_name'],
                     'message': f"Week {task['week']} task: {task['task']}",
                     'priority': 'high',
-                    'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    'created_at': now_str
                 })
         
         # Check if harvest is near (within 7 days)
-        harvest_date = datetime.strptime(activity['harvest_date'], '%Y-%m-%d')
-        days_to_harvest = (harvest_date - datetime.now()).days
+        days_to_harvest = (harvest_ts - now_ts) // 86400
         
         if 0 <= days_to_harvest <= 7:
             notifications.append({
@@ -562,7 +998,7 @@ def get_dashboard_notifications(user_id):
                 'crop': activity['crop_display_name'],
                 'message': f"Harvest ready in {days_to_harvest} days!",
                 'priority': 'high',
-                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                'created_at': now_str
             })
     
     # Add persistent notifications
@@ -571,69 +1007,57 @@ def get_dashboard_notifications(user_id):
     
     return notifications
 
+@safe_file_op(default=False)
 def add_notification(user_id, type, message, priority='medium', title=None, data=None):
     """Save a user notification to file"""
-    try:
-        notifications = []
-        if os.path.exists(NOTIFICATIONS_FILE):
-            with open(NOTIFICATIONS_FILE, 'r') as f:
-                notifications = json.load(f)
-        
-        # Determine title if not provided
-        if not title:
-            if type == 'equipment' or type == 'rental_request':
-                title = 'Equipment Rental'
-            elif type == 'system':
-                title = 'System Alert'
-            else:
-                title = 'Notification'
-
-        new_notif = {
-            'id': str(datetime.now().timestamp()),
-            'user_id': str(user_id),
-            'type': type,
-            'title': title,
-            'message': message,
-            'priority': priority,
-            'created_at': datetime.now().isoformat(),
-            'read': False,
-            'data': data or {}
-        }
-        notifications.append(new_notif)
-        
-        with open(NOTIFICATIONS_FILE, 'w') as f:
-            json.dump(notifications, f, indent=2)
-        return True
-    except Exception as e:
-        print(f"Error adding notification: {e}")
-        return False
-        
-def delete_notification(notification_id):
-    """Delete a notification by ID"""
-    try:
-        if not os.path.exists(NOTIFICATIONS_FILE):
-            return False
-            
-        with open(NOTIFICATIONS_FILE, 'r') as f:
-            notifications = json.load(f)
-            
-        initial_len = len(notifications)
-        notifications = [n for n in notifications if n.get('id') != notification_id]
+    # Determine title if not provided
+    if not title:
+        if type == 'equipment' or type == 'rental_request':
+            title = 'Equipment Rental'
+        elif type == 'system':
+            title = 'System Alert'
+        else:
+            title = 'Notification'
+
+    new_notif = {
+        'id': str(datetime.now().timestamp()),
+        'user_id': str(user_id),
+        'type': type,
+        'title': title,
+        'message': message,
+        'priority': priority,
+        'created_at': datetime.now().isoformat(),
+        'read': False,
+        'data': data or {}
+    }
+    _append_jsonl(_user_file('notifications', user_id), new_notif)
+    return True
         
-        if len(notifications) < initial_len:
-            with open(NOTIFICATIONS_FILE, 'w') as f:
-                json.dump(notifications, f, indent=2)
-            return True
-        return False
-    except Exception as e:
-        print(f"Error deleting notification: {e}")
-        return False
+@safe_file_op(default=False)
+def delete_notification(notification_id, user_id=None):
+    """Delete a notification by ID
+    
+    Pass the owner's user_id to go straight to their file; without it every
+    user's file is searched.
+    """
+    if user_id is not None:
+        paths = [_user_file('notifications', user_id)]
+    else:
+        paths = _shard_files('notifications')
+    
+    for path in paths:
+        with _locked(path):
+            notifications = _load_with_tail(path)
+            if _pop_by_id(notifications, notification_id, key='id'):
+                _write_base(path, notifications)
+                return True
+    return False
 
+@safe_file_op(default=False)
 def update_equipment(equipment_id, update_data):
     """Update generic equipment fields"""
-    try:
-        with open(EQUIPMENT_FILE, 'r') as f:
-            equipment = json.load(f)
+    with _locked(EQUIPMENT_FILE):
+        equipment = _load_with_tail(EQUIPMENT_FILE)
         
         updated = False
         for item in equipment:
@@ -644,136 +1068,204 @@ def update_equipment(equipment_id, update_data):
                 break
         
         if updated:
-            with open(EQUIPMENT_FILE, 'w') as f:
-                json.dump(equipment, f, indent=2)
+            _write_base(EQUIPMENT_FILE, equipment)
             return True
         return False
-    except Exception as e:
-        print(f"Error updating equipment: {e}")
-        return False
-    except Exception as e:
-        print(f"Error adding notification: {e}")
-        return False
 
+@safe_file_op(default=[])
 def get_persistent_notifications(user_id):
     """Retrieve saved notifications for a user"""
-    try:
-        if not os.path.exists(NOTIFICATIONS_FILE):
-            return []
-        with open(NOTIFICATIONS_FILE, 'r') as f:
-            all_notifs = json.load(f)
-            return [n for n in all_notifs if n.get('user_id') == str(user_id)]
-    except Exception as e:
-        print(f"Error loading notifications: {e}")
-        return []
+    return _read_records(_user_file('notifications', user_id))
 
+@safe_file_op(default=[])
 def get_all_equipment():
     """Get all listed equipment"""
-    try:
-        if not os.path.exists(EQUIPMENT_FILE):
-            return []
-        with open(EQUIPMENT_FILE, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading equipment: {e}")
-        return []
+    return _read_records(EQUIPMENT_FILE)
 
+@safe_file_op(default=None)
 def save_equipment(equipment_data):
     """Save a new equipment listing"""
-    import uuid
-    try:
-        equipment = get_all_equipment()
-        
-        # Generate unique ID and basic fields
-        equipment_id = str(uuid.uuid4())
-        equipment_data['_id'] = equipment_id
-        equipment_data['created_at'] = datetime.utcnow().isoformat()
-        equipment_data['status'] = 'available'
-        
-        equipment.append(equipment_data)
+    # Generate unique ID and basic fields
+    equipment_id = str(uuid.uuid4())
+    equipment_data['_id'] = equipment_id
+    equipment_data['created_at'] = datetime.utcnow().isoformat()
+    equipment_data['status'] = 'available'
+    
+    _append_jsonl(EQUIPMENT_FILE, equipment_data)
         
-        with open(EQUIPMENT_FILE, 'w') as f:
-            json.dump(equipment, f, indent=2)
-            
-        print(f"🚜 Equipment listed: {equipment_data.get('name')} [ID: {equipment_id}]")
-        return equipment_id
-    except Exception as e:
-        print(f"Error saving equipment: {e}")
-        return None
+    log.info("🚜 Equipment listed: %s [ID: %s]", equipment_data.get('name'), equipment_id)
+    return equipment_id
 
+@safe_file_op(default=False)
 def update_equipment_status(equipment_id, status):
     """Update equipment status (available, rented, etc.)"""
-    try:
-        equipment = get_all_equipment()
+    with _locked(EQUIPMENT_FILE):
+        equipment = _load_with_tail(EQUIPMENT_FILE)
         for item in equipment:
             if item.get('_id') == equipment_id:
                 item['status'] = status
                 item['updated_at'] = datetime.utcnow().isoformat()
                 break
         
-        with open(EQUIPMENT_FILE, 'w') as f:
-            json.dump(equipment, f, indent=2)
+        _write_base(EQUIPMENT_FILE, equipment)
         return True
+
+def _prepare_expense(expense_data):
+    """Give an expense its ObjectId (and user ObjectId) before it is queued"""
+    if 'user_id' in expense_data:
+        expense_data['user_id'] = _as_object_id(expense_data['user_id'])
+    expense_data.setdefault('_id', ObjectId())
+    return str(expense_data['_id'])
+
+def flush_expenses():
+    """Write every queued expense to MongoDB with one insert_many"""
+    global _expense_timer
+    with _expense_lock:
+        batch = _expense_queue[:]
+        _expense_queue.clear()
+        if _expense_timer is not None:
+            _expense_timer.cancel()
+            _expense_timer = None
+    if not batch:
+        return 0
+    
+    retry, dropped = [], []
+    try:
+        get_db().expenses.insert_many(batch, ordered=False)
+    except BulkWriteError as e:
+        # Unordered: everything not in writeErrors was inserted, and a
+        # duplicate key means an earlier attempt already stored that expense
+        for err in e.details.get('writeErrors', []):
+            code = err.get('code')
+            if code == 11000:
+                continue
+            failed = (batch[err['index']], err.get('errmsg', code))
+            if code in TRANSIENT_WRITE_CODES:
+                retry.append(failed)
+            else:
+                dropped.append(failed)
+    except ConnectionFailure as e:
+        # The server may still have applied the insert; a retry then reports
+        # those expenses as duplicates and drops them
+        retry = [(expense, e) for expense in batch]
     except Exception as e:
-        print(f"Error updating equipment status: {e}")
-        return False
+        dropped = [(expense, e) for expense in batch]
+    
+    with _expense_lock:
+        retrying = {id(expense) for expense, _ in retry}
+        for expense in batch:
+            if id(expense) not in retrying:
+                _expense_attempts.pop(expense['_id'], None)
+        requeue = []
+        for expense, reason in retry:
+            attempts = _expense_attempts.get(expense['_id'], 0) + 1
+            if attempts > EXPENSE_MAX_RETRIES:
+                _expense_attempts.pop(expense['_id'], None)
+                dropped.append((expense, reason))
+            else:
+                _expense_attempts[expense['_id']] = attempts
+                requeue.append(expense)
+        if requeue:
+            _expense_queue[:0] = requeue
+            _arm_expense_timer(EXPENSE_RETRY_INTERVAL)
+    
+    if requeue:
+        log.warning("⚠️ Will retry %s of %s expenses: %s", len(requeue), len(batch), retry[0][1])
+    for expense, reason in dropped:
+        log.error("❌ Dropping expense %s for user %s: %s",
+                  expense['_id'], expense.get('user_id'), reason)
+    return len(batch) - len(requeue) - len(dropped)
+
+atexit.register(flush_expenses)
+
+def _arm_expense_timer(interval):
+    """Schedule a flush unless one is pending; call with _expense_lock held"""
+    global _expense_timer
+    if _expense_timer is None:
+        _expense_timer = threading.Timer(interval, flush_expenses)
+        _expense_timer.daemon = True
+        _expense_timer.start()
+
+def _queue_expenses(expenses):
+    """Queue expenses for the next batched insert"""
+    with _expense_lock:
+        _expense_queue.extend(expenses)
+        flush_now = len(_expense_queue) >= EXPENSE_BATCH_SIZE
+        if not flush_now:
+            _arm_expense_timer(EXPENSE_FLUSH_INTERVAL)
+    if flush_now:
+        flush_expenses()
 
+def _uses_mongo():
+    """True when a MongoDB server, not a local stand-in, holds per-user data"""
+    with _db_lock:
+        return db is not None and not db_is_local
+
+@safe_file_op(default=None)
 def save_expense(expense_data):
     """Save a new expense entry (supports both MongoDB and JSON file fallback)"""
-    global db
-    try:
-        if db is not None:
-            # Check if ObjectId is needed for user_id
-            from bson import ObjectId
-            if 'user_id' in expense_data and isinstance(expense_data['user_id'], str):
-                try:
-                    expense_data['user_id'] = ObjectId(expense_data['user_id'])
-                except:
-                    pass
-            
-            result = db.expenses.insert_one(expense_data)
-            return str(result.inserted_id)
-        else:
-            # File fallback
-            import uuid
-            expense_id = str(uuid.uuid4())
-            expense_data['_id'] = expense_id
-            
-            expenses = []
-            if os.path.exists(EXPENSES_FILE):
-                with open(EXPENSES_FILE, 'r') as f:
-                    try:
-                        expenses = json.load(f)
-                    except:
-                        expenses = []
-            
-            expenses.append(expense_data)
-            with open(EXPENSES_FILE, 'w') as f:
-                json.dump(expenses, f, indent=2)
-            
-            return expense_id
-    except Exception as e:
-        print(f"Error saving expense: {e}")
-        return None
+    if _uses_mongo():
+        expense_id = _prepare_expense(expense_data)
+        _queue_expenses([expense_data])
+        return expense_id
+    else:
+        # File fallback
+        expense_id = str(uuid.uuid4())
+        expense_data['_id'] = expense_id
+        
+        _append_jsonl(_user_file('expenses', expense_data.get('user_id')), expense_data)
+        
+        return expense_id
 
+@safe_file_op(default=[])
+def save_expenses_bulk(expenses):
+    """Save several expense entries in one write and return their ids"""
+    if _uses_mongo():
+        expense_ids = [_prepare_expense(expense) for expense in expenses]
+        _queue_expenses(expenses)
+        return expense_ids
+    else:
+        by_user = {}
+        for expense in expenses:
+            expense['_id'] = str(uuid.uuid4())
+            by_user.setdefault(expense.get('user_id'), []).append(expense)
+        for user_id, user_expenses in by_user.items():
+            _append_jsonl(_user_file('expenses', user_id), *user_expenses)
+        return [expense['_id'] for expense in expenses]
+
+@safe_file_op(default=[])
 def get_user_expenses(user_id):
     """Get all expenses for a user (supports both MongoDB and JSON file fallback)"""
-    global db
-    try:
-        if db is not None:
-            from bson import ObjectId
-            query = {'user_id': ObjectId(user_id) if isinstance(user_id, str) else user_id}
-            return list(db.expenses.find(query).sort('entry_date', -1))
-        else:
-            # File fallback
-            if os.path.exists(EXPENSES_FILE):
-                with open(EXPENSES_FILE, 'r') as f:
-                    try:
-                        all_expenses = json.load(f)
-                        return [exp for exp in all_expenses if str(exp.get('user_id')) == str(user_id)]
-                    except:
-                        return []
-            return []
-    except Exception as e:
-        print(f"Error fetching expenses: {e}")
-        return []
+    if _uses_mongo():
+        # Make queued expenses visible before querying
+        flush_expenses()
+        query = {'user_id': _as_object_id(user_id)}
+        return list(db.expenses.find(query).sort('entry_date', -1))
+    else:
+        # File fallback
+        return _read_records(_user_file('expenses', user_id))
+
+def pretty_print_files():
+    """Rewrite every data file as indented JSON for reading by hand
+    
+    Files are written compact in normal operation; the next write of a file
+    compacts it again.
+    """
+    paths = [USERS_FILE, CROPS_FILE, DISEASES_FILE, EQUIPMENT_FILE,
+             PHONE_INDEX_FILE, EMAIL_INDEX_FILE]
+    for collection in SHARDED_COLLECTIONS:
+        paths.extend(_shard_files(collection))
+    
+    for path in paths:
+        if not (os.path.exists(path) or os.path.exists(path + '.jsonl')):
+            continue
+        with _locked(path):
+            _write_base(path, _load_with_tail(path), pretty=True)
+        log.info("📝 Pretty-printed %s", os.path.relpath(path, DATA_DIR))
+
+if __name__ == '__main__':
+    # python -m utils.db pretty
+    if sys.argv[1:] != ['pretty']:
+        sys.exit('usage: python -m utils.db pretty')
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    pretty_print_files()